@@ -3,6 +3,13 @@ import React, { useState } from 'react';
 
 // Use environment variable or fallback to local
 const API_URL = process.env.REACT_APP_API_URL || "http://localhost:5000";
+const POLL_INTERVAL_MS = 2000;
+// Give up eventually: a task whose worker died, or an unknown/expired task id,
+// reports "started"/"pending" forever.
+const MAX_POLL_ATTEMPTS = 900; // 30 minutes at POLL_INTERVAL_MS
+const PENDING_STATUSES = ["queued", "pending", "started", "retry"];
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
 
 function App() {
   const [url, setUrl] = useState("");
@@ -18,7 +25,21 @@ function App() {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ url }),
       });
-      const data = await response.json();
+      let data = await response.json();
+
+      // Downloads run in a background task; poll until it finishes.
+      let attempts = 0;
+      while (data.task_id && PENDING_STATUSES.includes(data.status)) {
+        if (attempts >= MAX_POLL_ATTEMPTS) {
+          setResult(`Error: download task ${data.task_id} did not finish in time (last status: ${data.status}).`);
+          return;
+        }
+        attempts += 1;
+        setResult(`Downloading... (${data.status})`);
+        await sleep(POLL_INTERVAL_MS);
+        const poll = await fetch(`${API_URL}/download/${data.task_id}`);
+        data = await poll.json();
+      }
       setResult(JSON.stringify(data, null, 2));
     } catch (err) {
       setResult("Error: " + err.message);
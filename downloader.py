@@ -1,17 +1,50 @@
 import os
-import subprocess
+import re
+import asyncio
 import logging
 from urllib.parse import urlparse
 from datetime import datetime
 import time
 import shutil
 import json
-import psutil # Added for disk space monitoring
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
 
 # --- Configuration ---
 DOWNLOAD_DIR = "downloads"
 DISK_SPACE_THRESHOLD_PERCENT = 90  # Warn/Abort if disk usage exceeds this percentage
 CLEANUP_DAYS_OLD = 30              # Delete files older than this many days
+CLEANUP_WORKERS = 32               # Threads issuing stat/unlink calls concurrently during cleanup
+DISK_CHECK_TTL_SECONDS = 5.0       # Reuse a disk usage result for this long before re-checking
+# Resolved once at import; os.path.abspath calls os.getcwd() every time.
+ABS_DOWNLOAD_DIR = os.path.abspath(DOWNLOAD_DIR)
+ABS_DOWNLOAD_DIR_PREFIX = ABS_DOWNLOAD_DIR + os.sep
+MAX_CONCURRENT_DOWNLOADS = 8       # Cap on simultaneous yt-dlp downloads per batch
+OUTPUT_TEMPLATE = "%(title).70s.%(ext)s"
+
+# Base yt-dlp options shared by every download. The output template (a fresh dict, since
+# YoutubeDL fills default keys into it in place) and the output folder are added per call.
+# yt-dlp's requests/urllib3 handler keeps a pooled keep-alive session per YoutubeDL instance.
+# _run_yt_dlp builds one instance per download, so the info, thumbnail and HLS/DASH fragment
+# requests of a single download reuse connections; nothing is pooled across downloads.
+_YDL_OPTS = {
+    "noplaylist": True,      # Download single video, not entire playlist
+    "writethumbnail": True,  # Download thumbnail
+    "writeinfojson": True,   # Download info JSON (yt-dlp strips private keys from it)
+    "noprogress": True,      # Don't emit a progress line per downloaded chunk
+    "logger": logging.getLogger("yt_dlp"), # Route yt-dlp output through logging instead of stdout
+}
+
+# Anything other than word characters (alphanumerics and underscore), space, dot, or hyphen
+_SANITIZE_RE = re.compile(r"[^\w .-]")
+
+# (path, threshold_percent) -> (time.monotonic() of the check, result)
+_disk_check_cache = {}
+
+# (int(time.time()) of the last format, "YYYY-MM-DD"); one tuple so threads swap it atomically
+_date_cache = (None, "")
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -30,27 +63,42 @@ def sanitize_filename(filename):
     Sanitizes a string to be used as a filename or path component.
     Removes/replaces characters that are not alphanumeric, space, dot, underscore, or hyphen.
     """
-    return "".join(c if c.isalnum() or c in " ._-" else "_" for c in filename)
+    # A single C-level regex substitution instead of a per-character Python loop
+    return _SANITIZE_RE.sub("_", filename)
+
+def _disk_usage_stats(path: str):
+    """
+    Returns (percentage in use, free bytes) for the filesystem holding 'path'.
+    """
+    disk_usage = shutil.disk_usage(path)
+    return (disk_usage.used / disk_usage.total) * 100, disk_usage.free
 
 def check_disk_usage(path: str = os.getcwd(), threshold_percent: int = DISK_SPACE_THRESHOLD_PERCENT) -> bool:
     """
     Checks disk usage for a given path and logs a warning if it exceeds a threshold.
     Returns True if usage is above threshold, False otherwise.
+    Results are cached for DISK_CHECK_TTL_SECONDS so bursts of downloads share one check.
     """
+    cache_key = (path, threshold_percent)
+    now = time.monotonic()
+    cached = _disk_check_cache.get(cache_key)
+    if cached is not None and now - cached[0] < DISK_CHECK_TTL_SECONDS:
+        return cached[1]
+
     try:
-        # psutil.disk_usage checks the filesystem that 'path' resides on.
+        # shutil.disk_usage (a single statvfs) checks the filesystem that 'path' resides on.
         # Use os.path.abspath to ensure we're checking the correct root partition.
         abs_path = os.path.abspath(path)
-        disk_usage = psutil.disk_usage(abs_path)
-        used_percent = disk_usage.percent
-        free_gb = disk_usage.free / (1024**3) # Convert bytes to GB
+        used_percent, free_bytes = _disk_usage_stats(abs_path)
+        free_gb = free_bytes / (1024**3) # Convert bytes to GB
 
         logging.info(f"Disk usage for {abs_path}: {used_percent:.2f}% used, {free_gb:.2f} GB free.")
 
-        if used_percent >= threshold_percent:
+        over_threshold = used_percent >= threshold_percent
+        if over_threshold:
             logging.warning(f"CRITICAL: Disk usage for {abs_path} is at {used_percent:.2f}%, exceeding threshold of {threshold_percent}%.")
-            return True
-        return False
+        _disk_check_cache[cache_key] = (now, over_threshold)
+        return over_threshold
     except FileNotFoundError:
         logging.error(f"Cannot check disk usage: Path '{path}' does not exist.")
         return False
@@ -58,6 +106,49 @@ def check_disk_usage(path: str = os.getcwd(), threshold_percent: int = DISK_SPAC
         logging.error(f"Error checking disk usage for {path}: {e}")
         return False
 
+def _scan_tree(path: str):
+    """
+    Recursively yields os.DirEntry objects under path, bottom up (a directory comes after its contents).
+    DirEntry caches the file type from the directory read, saving a stat per entry over os.walk + os.stat.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        # Like os.walk, skip directories that vanished or can't be read instead of aborting cleanup
+        logging.error(f"Error scanning directory {path}: {e}")
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _scan_tree(entry.path)
+        yield entry
+
+def _is_empty_dir(path: str) -> bool:
+    """
+    Returns True if path has no entries, stopping at the first one instead of listing them all.
+    """
+    with os.scandir(path) as it:
+        return next(it, None) is None
+
+def _delete_if_old(entry: os.DirEntry, cutoff_time: float) -> bool:
+    """
+    Deletes the file behind entry if it was last modified before cutoff_time.
+    Returns True if the file was deleted.
+    """
+    try:
+        # Check modification time; a file that vanished in the meantime raises FileNotFoundError
+        if entry.stat(follow_symlinks=False).st_mtime < cutoff_time:
+            os.unlink(entry.path)
+            logging.info(f"Deleted old file: {entry.path}")
+            return True
+    except FileNotFoundError:
+        pass # Already removed by someone else
+    except OSError as e:
+        logging.error(f"Error deleting file {entry.path}: {e}")
+    except Exception as e:
+        logging.error(f"Unexpected error during file deletion {entry.path}: {e}")
+    return False
+
 def clean_old_downloads(days_old: int = CLEANUP_DAYS_OLD):
     """
     Deletes files and empty directories in DOWNLOAD_DIR older than a specified number of days.
@@ -70,43 +161,79 @@ def clean_old_downloads(days_old: int = CLEANUP_DAYS_OLD):
     cutoff_time = time.time() - (days_old * 24 * 60 * 60) # Convert days to seconds
 
     logging.info(f"Starting cleanup of downloads older than {days_old} days in {DOWNLOAD_DIR}")
-    deleted_files_count = 0
     deleted_dirs_count = 0
 
-    # Walk from bottom up to ensure empty directories can be removed
-    for root, dirs, files in os.walk(DOWNLOAD_DIR, topdown=False):
-        for name in files:
-            filepath = os.path.join(root, name)
-            try:
-                # Check modification time, ensure file still exists to prevent race conditions
-                if os.path.exists(filepath) and os.stat(filepath).st_mtime < cutoff_time:
-                    os.remove(filepath)
-                    logging.info(f"Deleted old file: {filepath}")
-                    deleted_files_count += 1
-            except OSError as e:
-                logging.error(f"Error deleting file {filepath}: {e}")
-            except Exception as e:
-                logging.error(f"Unexpected error during file deletion {filepath}: {e}")
+    # Collect everything first; _scan_tree yields bottom up, so dirs stays deepest-first
+    files = []
+    dirs = []
+    for entry in _scan_tree(DOWNLOAD_DIR):
+        (dirs if entry.is_dir(follow_symlinks=False) else files).append(entry)
+
+    # unlink is latency-bound, not CPU-bound, so overlap many of them
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        deleted_files_count = sum(executor.map(lambda entry: _delete_if_old(entry, cutoff_time), files))
+
+    # Directories are handled in order after all files, so parents see their children removed
+    for entry in dirs:
+        try:
+            # After files are deleted, check if directory is empty before removing
+            if _is_empty_dir(entry.path):
+                os.rmdir(entry.path)
+                logging.info(f"Deleted empty directory: {entry.path}")
+                deleted_dirs_count += 1
+                # A removed directory may be remembered as created by _ensure_dir
+                _ensure_dir.cache_clear()
+        except FileNotFoundError:
+            pass # Already removed by someone else
+        except OSError as e:
+            logging.error(f"Error deleting directory {entry.path}: {e}")
+        except Exception as e:
+            logging.error(f"Unexpected error during directory deletion {entry.path}: {e}")
 
+    logging.info(f"Cleanup finished. Deleted {deleted_files_count} files and {deleted_dirs_count} empty directories.")
 
-        for name in dirs:
-            dirpath = os.path.join(root, name)
-            try:
-                # After files are deleted, check if directory is empty before removing
-                if os.path.exists(dirpath) and not os.listdir(dirpath):
-                    os.rmdir(dirpath)
-                    logging.info(f"Deleted empty directory: {dirpath}")
-                    deleted_dirs_count += 1
-            except OSError as e:
-                logging.error(f"Error deleting directory {dirpath}: {e}")
-            except Exception as e:
-                logging.error(f"Unexpected error during directory deletion {dirpath}: {e}")
+def _today() -> str:
+    """
+    Returns today's local date as YYYY-MM-DD, re-running strftime at most once per second.
+    """
+    global _date_cache
+    now = int(time.time())
+    cached_second, cached_date = _date_cache
+    if cached_second != now:
+        cached_date = datetime.now().strftime("%Y-%m-%d")
+        _date_cache = (now, cached_date)
+    return cached_date
+
+@lru_cache(maxsize=1024)
+def _ensure_dir(path: str):
+    """
+    Creates path (and parents) once per process; repeat downloads to the same
+    domain/date folder skip the mkdir syscalls. A stale entry after a cleanup run in
+    another process is harmless: yt-dlp creates the output file's directory itself.
+    """
+    os.makedirs(path, exist_ok=True)
 
-    logging.info(f"Cleanup finished. Deleted {deleted_files_count} files and {deleted_dirs_count} empty directories.")
+def _run_yt_dlp(url: str, save_path: str):
+    """
+    Runs an in-process yt-dlp download into save_path.
+    Returns the absolute path of the final file, or None if yt-dlp didn't report one.
+    """
+    opts = {**_YDL_OPTS, "outtmpl": {"default": OUTPUT_TEMPLATE}, "paths": {"home": save_path}}
+    with YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        if not info:
+            return None
+        # yt-dlp records the final (post-merge/remux) path of each download it performed;
+        # scan from the end and stop at the last one rather than re-evaluating outtmpl.
+        for requested in reversed(info.get("requested_downloads") or ()):
+            filepath = requested.get("filepath")
+            if filepath:
+                return os.path.abspath(filepath)
+        return os.path.abspath(ydl.prepare_filename(info))
 
 # --- Main Download Function ---
 
-def download_content(url: str):
+async def download_content(url: str):
     """
     Downloads content from the given URL using yt-dlp, saving it to an organized directory structure.
     Includes disk space check before download.
@@ -115,105 +242,79 @@ def download_content(url: str):
         logging.error("Empty URL provided for download.")
         return {"status": "error", "error": "Empty URL provided."}
 
-    # Ensure the base download directory exists
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-
-    # Check disk space before proceeding
-    if check_disk_usage(path=DOWNLOAD_DIR, threshold_percent=DISK_SPACE_THRESHOLD_PERCENT):
-        logging.error(f"Disk space is critically low ({DISK_SPACE_THRESHOLD_PERCENT}% threshold). Aborting download for {url}.")
-        return {"status": "error", "error": f"Disk space critically low. Please free up space. Current usage: {psutil.disk_usage(os.path.abspath(DOWNLOAD_DIR)).percent:.2f}%."}
-
-    logging.info(f"Starting download for: {url}")
-
     domain = urlparse(url).netloc
-    date_folder = datetime.now().strftime("%Y-%m-%d")
+    date_folder = _today()
     # Using sanitize_filename for domain to create valid directory names
     save_path = os.path.join(DOWNLOAD_DIR, sanitize_filename(domain), date_folder)
 
-    os.makedirs(save_path, exist_ok=True)
+    # Also creates DOWNLOAD_DIR itself
+    _ensure_dir(save_path)
     logging.info(f"Saving content to: {save_path}")
 
-    # yt-dlp command with --print-json for reliable output parsing
-    command = [
-        "yt-dlp",
-        "--no-playlist",          # Download single video, not entire playlist
-        "--write-thumbnail",      # Download thumbnail
-        "--write-info-json",      # Download info JSON
-        "--output", os.path.join(save_path, "%(title).70s.%(ext)s"), # Output format
-        "--print-json",           # Print final video metadata as JSON to stdout
-        url
-    ]
+    # Check disk space before proceeding
+    if check_disk_usage(path=DOWNLOAD_DIR, threshold_percent=DISK_SPACE_THRESHOLD_PERCENT):
+        logging.error(f"Disk space is critically low ({DISK_SPACE_THRESHOLD_PERCENT}% threshold). Aborting download for {url}.")
+        return {"status": "error", "error": f"Disk space critically low. Please free up space. Current usage: {_disk_usage_stats(ABS_DOWNLOAD_DIR)[0]:.2f}%."}
+
+    logging.info(f"Starting download for: {url}")
 
     try:
-        # Use capture_output=True to get stdout and stderr
-        result = subprocess.run(command, capture_output=True, text=True, check=True, encoding='utf-8')
-        logging.info("Download command executed successfully.")
+        # YoutubeDL blocks for the whole download, so run it off the event loop.
+        abs_path = await asyncio.to_thread(_run_yt_dlp, url, save_path)
+        logging.info("Download executed successfully.")
 
         video_filename = None
-        yt_dlp_info = None
-
-        # Parse the JSON output from yt-dlp. It's usually the last complete JSON object.
-        # yt-dlp can print multiple lines (progress, etc.) before the final JSON.
-        json_lines = [line for line in result.stdout.splitlines() if line.strip().startswith('{') and line.strip().endswith('}')]
-        if json_lines:
-            try:
-                # Attempt to parse the last JSON object, which typically contains final file info
-                yt_dlp_info = json.loads(json_lines[-1])
-                # _filename is the key for the final file path in yt-dlp's JSON output
-                if '_filename' in yt_dlp_info:
-                    abs_path = yt_dlp_info['_filename']
-                    # Ensure the path is relative to DOWNLOAD_DIR if it's within it
-                    if os.path.abspath(abs_path).startswith(os.path.abspath(DOWNLOAD_DIR)):
-                        video_filename = os.path.relpath(abs_path, DOWNLOAD_DIR)
-                    else:
-                        # Fallback if _filename is outside expected dir (shouldn't happen with --output)
-                        video_filename = abs_path
-                    logging.info(f"Final video file identified from JSON: {video_filename}")
-                else:
-                    logging.warning("'_filename' key not found in yt-dlp JSON output.")
-            except json.JSONDecodeError as e:
-                logging.warning(f"Could not decode yt-dlp JSON output: {e}")
-            except Exception as e:
-                logging.warning(f"Error processing yt-dlp JSON output: {e}")
+        if abs_path:
+            # Ensure the path is relative to DOWNLOAD_DIR if it's within it
+            # (_run_yt_dlp already returns an absolute path)
+            if abs_path.startswith(ABS_DOWNLOAD_DIR_PREFIX):
+                video_filename = abs_path[len(ABS_DOWNLOAD_DIR_PREFIX):]
+            else:
+                # Fallback if the file is outside expected dir (shouldn't happen with outtmpl)
+                video_filename = abs_path
+            logging.info(f"Final video file identified: {video_filename}")
         else:
-            logging.warning("No complete JSON object found in yt-dlp stdout. Falling back to stdout parsing.")
-            # Fallback for older yt-dlp versions or unusual outputs
-            for line in result.stdout.splitlines():
-                if "Merging formats into" in line and (".mp4" in line or ".mkv" in line):
-                    try:
-                        # Extract file path, assuming it's enclosed in quotes
-                        start = line.find('"') + 1
-                        end = line.rfind('"')
-                        if start > 0 and end > start:
-                            abs_path = line[start:end]
-                            if os.path.abspath(abs_path).startswith(os.path.abspath(DOWNLOAD_DIR)):
-                                video_filename = os.path.relpath(abs_path, DOWNLOAD_DIR)
-                            else:
-                                video_filename = abs_path # Keep as absolute if outside for some reason
-                            logging.info(f"Final video file identified from stdout (fallback): {video_filename}")
-                            break # Found it, no need to check other lines
-                    except Exception as e:
-                        logging.warning(f"Error parsing merge line: {e}")
-
-        if video_filename is None:
-            logging.warning("Could not determine final video filename from yt-dlp output.")
+            logging.warning("Could not determine final video filename from yt-dlp info.")
 
         return {
             "status": "success",
-            "output": result.stdout, # Include full stdout for debugging if needed
             "video_filename": video_filename # Relative path for frontend use
         }
 
-    except subprocess.CalledProcessError as e:
-        logging.error(f"yt-dlp command failed with error code {e.returncode}: {e.stderr}")
-        return {"status": "error", "error": e.stderr}
-    except FileNotFoundError:
-        logging.error("yt-dlp command not found. Make sure yt-dlp is installed and in your PATH.")
-        return {"status": "error", "error": "yt-dlp not found. Please install it."}
+    except DownloadError as e:
+        logging.error(f"yt-dlp download failed: {e}")
+        return {"status": "error", "error": str(e)}
     except Exception as e:
         logging.error(f"An unexpected error occurred during download: {e}")
         return {"status": "error", "error": str(e)}
 
+async def download_batch(urls: list, max_concurrency: int = MAX_CONCURRENT_DOWNLOADS):
+    """
+    Downloads several URLs concurrently, returning one download_content result per URL, in order.
+    Each result also carries its "url" so callers can match results without the original list.
+    A semaphore bounds how many yt-dlp downloads run at once to avoid thread and connection storms.
+    """
+    # Created per batch: each Celery task runs download_batch under its own asyncio.run,
+    # and an asyncio.Semaphore can't be shared across event loops.
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded_download(url):
+        async with semaphore:
+            # Never let one URL's exception escape: that would cancel the whole TaskGroup.
+            try:
+                result = await download_content(url)
+            except Exception as e:
+                logging.error(f"Unexpected error downloading {url!r} in batch: {e}")
+                result = {"status": "error", "error": str(e)}
+        return {"url": url, **result}
+
+    logging.info(f"Starting batch download of {len(urls)} URLs (max {max_concurrency} concurrent).")
+    # bounded_download turns every failure into an error dict, so one bad URL doesn't cancel the group.
+    async with asyncio.TaskGroup() as tg:
+        tasks = [tg.create_task(bounded_download(url)) for url in urls]
+
+    return [task.result() for task in tasks]
+
 # --- Main Execution Block (for direct script execution/testing) ---
 if __name__ == "__main__":
     # This block runs only when the script is executed directly (e.g., python downloader.py)
@@ -239,6 +340,6 @@ if __name__ == "__main__":
     # Note: In a real API, this would be triggered by an HTTP request.
     # test_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ" # Example YouTube URL
     # logging.info(f"\n--- Attempting to download test URL: {test_url} ---")
-    # result = download_content(test_url)
+    # result = asyncio.run(download_content(test_url))
     # logging.info(f"Download Result: {json.dumps(result, indent=2)}")
     # logging.info("--- Test Download Complete ---\n")
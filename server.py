@@ -1,17 +1,36 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from urllib.parse import quote
 from flask_cors import CORS # Import CORS
-from downloader import download_content, DOWNLOAD_DIR # Import DOWNLOAD_DIR from downloader
+from celery.result import AsyncResult
+from downloader import DOWNLOAD_DIR, ABS_DOWNLOAD_DIR # Import DOWNLOAD_DIR from downloader
+from tasks import celery, download_task, download_batch_task
 import os
+import mimetypes
 import logging # Import logging
 
 # --- App Setup ---
-# React static files will be served from here
-app = Flask(__name__, static_folder="client/build", static_url_path="/")
+# React static files will be served from here, by serve_react below. Flask's built-in
+# static route is disabled: mounted at "/" it would shadow serve_react for every path.
+FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "client", "build")
+app = Flask(__name__, static_folder=None)
 
 # Enable CORS for all origins on all routes (for development)
 # In production, restrict this to your frontend's actual domain(s)
 CORS(app)
 
+# When set (e.g. "/internal/downloads/"), downloaded files are handed off to the fronting
+# nginx via X-Accel-Redirect so it streams them with sendfile(2) instead of a Python worker.
+# The prefix must map to DOWNLOAD_DIR through an `internal` nginx location.
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX")
+
+# Largest 'urls' list accepted by /download_batch; one batch occupies a single worker
+MAX_BATCH_URLS = 50
+
+# Cache-Control max-age for content-hashed React build assets (one year)
+HASHED_ASSET_MAX_AGE = 31536000
+
 # --- Logging Configuration ---
 # You can use Flask's built-in logger or configure Python's standard logging.
 # Here, we'll configure a basic file logger for the server itself.
@@ -29,10 +48,32 @@ app.logger.setLevel(logging.INFO)
 
 # --- API Routes ---
 
+def build_download_response(result):
+    """
+    Converts a download_content result into the JSON payload returned to the frontend.
+    """
+    if result.get("status") == "error":
+        return {"status": "error", "error": result.get("error", "An unknown error occurred during download.")}
+
+    video_filename = result.get("video_filename")
+    if not video_filename:
+        return {
+            "status": "success",
+            "message": "Download completed, but could not determine direct video URL. Check server logs."
+        }
+
+    # Construct the URL for the downloaded file
+    return {
+        "status": "success",
+        "video_url": f"/downloads/{video_filename}",
+        "message": "Content downloaded successfully!"
+    }
+
+
 @app.route("/download", methods=["POST"])
 def handle_download():
     """
-    Handles download requests, calls the downloader, and returns a URL to the downloaded file.
+    Handles download requests by queueing a Celery task and returning its id for polling.
     """
     data = request.json
     if not data or "url" not in data:
@@ -43,39 +84,73 @@ def handle_download():
     app.logger.info(f"Received download request for URL: {url_to_download}")
 
     try:
-        # Call the download_content function from downloader.py
-        # IMPORTANT: For production, this should be an asynchronous task (e.g., Celery)
-        # to prevent blocking the web server.
-        result = download_content(url_to_download)
-
-        if result.get("status") == "error":
-            error_message = result.get("error", "An unknown error occurred during download.")
-            app.logger.error(f"Download failed for {url_to_download}: {error_message}")
-            return jsonify({"status": "error", "error": error_message}), 500
-
-        video_filename = result.get("video_filename")
-
-        if not video_filename:
-            app.logger.warning(f"Download successful for {url_to_download} but no specific video filename was returned by downloader.")
-            return jsonify({
-                "status": "success",
-                "message": "Download completed, but could not determine direct video URL. Check server logs."
-            }), 200 # Or 202 if it's a background process
-
-        # Construct the URL for the downloaded file
-        video_url = f"/downloads/{video_filename}"
-        app.logger.info(f"Download successful for {url_to_download}. Video available at: {video_url}")
-
-        return jsonify({
-            "status": "success",
-            "video_url": video_url,
-            "message": "Content downloaded successfully!"
-        })
+        # The download itself runs in a Celery worker; poll /download/<task_id> for the result.
+        task = download_task.delay(url_to_download)
+    except Exception as e:
+        app.logger.exception(f"Could not queue download for {url_to_download}") # logs traceback
+        return jsonify({"status": "error", "error": f"Internal server error: {str(e)}"}), 500
+
+    app.logger.info(f"Queued download for {url_to_download} as task {task.id}")
+    return jsonify({"status": "queued", "task_id": task.id}), 202
+
+
+@app.route("/download_batch", methods=["POST"])
+def handle_batch():
+    """
+    Handles batch download requests: queues one Celery task that downloads every URL
+    in 'urls' concurrently. Poll /download/<task_id> for the per-URL results.
+    """
+    data = request.json
+    if not data or not isinstance(data.get("urls"), list) or not data["urls"]:
+        app.logger.warning("Received batch download request with missing or empty 'urls' list.")
+        return jsonify({"error": "Missing 'urls' list in request."}), 400
+
+    urls = data["urls"]
+    if not all(isinstance(url, str) and url.strip() for url in urls):
+        app.logger.warning("Received batch download request with non-string or empty URLs.")
+        return jsonify({"error": "Every entry in 'urls' must be a non-empty string."}), 400
+    if len(urls) > MAX_BATCH_URLS:
+        app.logger.warning(f"Rejected batch download request with {len(urls)} URLs (limit {MAX_BATCH_URLS}).")
+        return jsonify({"error": f"Too many URLs in batch; the limit is {MAX_BATCH_URLS}."}), 400
 
+    app.logger.info(f"Received batch download request for {len(urls)} URLs")
+
+    try:
+        task = download_batch_task.delay(urls)
     except Exception as e:
-        app.logger.exception(f"An unexpected error occurred while handling download for {url_to_download}") # logs traceback
+        app.logger.exception("Could not queue batch download")
         return jsonify({"status": "error", "error": f"Internal server error: {str(e)}"}), 500
 
+    app.logger.info(f"Queued batch download of {len(urls)} URLs as task {task.id}")
+    return jsonify({"status": "queued", "task_id": task.id}), 202
+
+
+@app.route("/download/<task_id>", methods=["GET"])
+def download_status(task_id):
+    """
+    Reports the state of a queued download task, including the video URL(s) once finished.
+    """
+    task = AsyncResult(task_id, app=celery)
+
+    if task.state in ("PENDING", "STARTED", "RETRY"):
+        return jsonify({"status": task.state.lower(), "task_id": task_id}), 202
+
+    if task.state != "SUCCESS":
+        # FAILURE, REVOKED, ...: task.result is an exception (or None), not a download result
+        app.logger.error(f"Download task {task_id} ended in state {task.state}: {task.result}")
+        error_message = str(task.result) if task.result is not None else f"Download task {task.state.lower()}."
+        return jsonify({"status": "error", "task_id": task_id, "error": error_message}), 500
+
+    result = task.result
+    if isinstance(result, list):
+        # Batch task: one download_content result per URL, in request order
+        results = [{"url": r.get("url"), **build_download_response(r)} for r in result]
+        return jsonify({"status": "success", "task_id": task_id, "results": results})
+
+    response = build_download_response(result)
+    response["task_id"] = task_id
+    return jsonify(response), 500 if response["status"] == "error" else 200
+
 
 # Serve downloaded video files
 @app.route("/downloads/<path:filename>")
@@ -84,15 +159,27 @@ def serve_download(filename):
     Serves downloaded files from the DOWNLOAD_DIR.
     """
     # Ensure the DOWNLOAD_DIR exists and is used
-    full_download_path = os.path.abspath(DOWNLOAD_DIR)
-    app.logger.info(f"Serving request for downloaded file: {filename} from {full_download_path}")
+    full_download_path = ABS_DOWNLOAD_DIR
+    app.logger.debug("Serving request for downloaded file: %s from %s", filename, full_download_path)
+
+    # Reject paths escaping DOWNLOAD_DIR
+    file_path = safe_join(full_download_path, filename)
+    if file_path is None:
+        app.logger.warning(f"Rejected unsafe download path: {filename}")
+        return jsonify({"error": "File not found."}), 404
 
-    # For security, send_from_directory is preferred.
+    if X_ACCEL_REDIRECT_PREFIX:
+        # nginx itself answers 404 for missing files.
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        return Response(mimetype=mimetype, headers={"X-Accel-Redirect": X_ACCEL_REDIRECT_PREFIX + quote(filename)})
+
+    # conditional=True honors Range/If-None-Match, so <video> seeks fetch only the bytes they need;
+    # under a WSGI server with wsgi.file_wrapper the body goes out via sendfile(2).
     # as_attachment=False means the browser will try to display/play it.
-    # as_attachment=True means the browser will prompt to download it.
     try:
-        return send_from_directory(full_download_path, filename, as_attachment=False)
-    except FileNotFoundError:
+        return send_file(file_path, as_attachment=False, conditional=True, etag=True)
+    except (FileNotFoundError, IsADirectoryError):
+        # Only regular files are served; don't leak server paths from the OSError message
         app.logger.warning(f"Requested downloaded file not found: {filename}")
         return jsonify({"error": "File not found."}), 404
     except Exception as e:
@@ -102,6 +189,22 @@ def serve_download(filename):
 
 # --- Frontend Serving Routes ---
 
+def collect_static_files(static_folder):
+    """
+    Returns the set of files under static_folder as '/'-separated paths relative to it.
+    """
+    static_files = set()
+    for root, _, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        for name in files:
+            rel_path = name if rel_root == "." else os.path.join(rel_root, name)
+            static_files.add(rel_path.replace(os.sep, "/"))
+    return frozenset(static_files)
+
+# The React build is fixed at deploy time, so index it once instead of stat-ing per request.
+# Restart (or HUP) the server after rebuilding the client to pick up new files.
+STATIC_FILES = collect_static_files(FRONTEND_BUILD_DIR)
+
 # Serve React frontend (client/build) - handles client-side routing
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
@@ -110,27 +213,27 @@ def serve_react(path):
     Serves the React frontend's static files.
     For any path not matching a static file, it falls back to index.html for client-side routing.
     """
-    # Debugging print statements are replaced with app.logger.info for production readiness
-    app.logger.info(f"Requested path for static files: {path}")
-
-    # Construct the full path to the requested file within the static folder
-    full_path_in_static = os.path.join(app.static_folder, path)
+    # Per-request tracing is DEBUG-only and lazily formatted, so it costs nothing at INFO
+    app.logger.debug("Requested path for static files: %s", path)
 
     # Check if the requested path refers to an actual file in the static folder
     # and it's not the root path (which should always serve index.html initially)
-    if path != "" and os.path.exists(full_path_in_static) and os.path.isfile(full_path_in_static):
-        return send_from_directory(app.static_folder, path)
-    else:
-        # If the path doesn't correspond to a static file, serve index.html
-        # This is crucial for single-page applications (SPAs) with client-side routing.
-        index_html_path = os.path.join(app.static_folder, "index.html")
-        app.logger.info(f"Serving index.html for path: {path} (checking at: {index_html_path})")
-
-        if not os.path.exists(index_html_path):
-            app.logger.critical("Frontend build missing! index.html not found in static folder.")
-            return "Internal Server Error: Frontend build (index.html) not found. Please run 'npm run build' in your client directory.", 500
-
-        return send_from_directory(app.static_folder, "index.html")
+    if path != "" and path in STATIC_FILES:
+        # CRA puts content-hashed bundles under static/, so browsers may cache them for good
+        max_age = HASHED_ASSET_MAX_AGE if path.startswith("static/") else None
+        try:
+            return send_from_directory(FRONTEND_BUILD_DIR, path, max_age=max_age)
+        except NotFound:
+            pass # Removed since startup; fall through to index.html
+
+    # If the path doesn't correspond to a static file, serve index.html
+    # This is crucial for single-page applications (SPAs) with client-side routing.
+    app.logger.debug("Serving index.html for path: %s", path)
+    try:
+        return send_from_directory(FRONTEND_BUILD_DIR, "index.html")
+    except NotFound:
+        app.logger.critical("Frontend build missing! index.html not found in static folder.")
+        return "Internal Server Error: Frontend build (index.html) not found. Please run 'npm run build' in your client directory.", 500
 
 
 # --- Main Application Run ---
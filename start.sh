@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+# Runs the Celery worker next to gunicorn in one service, so the worker saves downloads
+# to the same downloads/ directory the web server serves them from.
+# If either process exits, the other is stopped so the platform restarts the service.
+# On TERM, Celery does a warm shutdown (finishes in-flight downloads), so wait for it
+# instead of exiting and leaving those tasks stuck in STARTED.
+trap 'kill -TERM $(jobs -p) 2>/dev/null; wait' TERM INT EXIT
+
+celery -A tasks worker --loglevel=info &
+gunicorn server:app &
+
+wait -n
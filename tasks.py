@@ -0,0 +1,32 @@
+import asyncio
+import os
+from celery import Celery
+from downloader import download_content, download_batch
+
+# --- Celery Setup ---
+# Downloads run in a Celery worker so the web server only enqueues work and returns.
+# Start a worker with: celery -A tasks worker --loglevel=info
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+
+celery = Celery("dow", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+celery.conf.update(
+    task_track_started=True,    # Report STARTED so clients can tell queued from running
+    result_expires=24 * 60 * 60 # Keep results around for a day of polling
+)
+
+# --- Tasks ---
+
+@celery.task(name="dow.download")
+def download_task(url: str):
+    """
+    Celery task wrapper around downloader.download_content.
+    """
+    return asyncio.run(download_content(url))
+
+@celery.task(name="dow.download_batch")
+def download_batch_task(urls: list):
+    """
+    Celery task wrapper around downloader.download_batch.
+    """
+    return asyncio.run(download_batch(urls))